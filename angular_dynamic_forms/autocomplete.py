@@ -1,5 +1,4 @@
 import inspect
-import re
 from functools import lru_cache
 from urllib.parse import urlsplit
 
@@ -8,6 +7,8 @@ from rest_framework import renderers
 from rest_framework.decorators import detail_route, list_route, action
 from rest_framework.response import Response
 
+from .rest import _FORM_PATH_RE
+
 
 class AutoCompleteMixin(object):
     max_returned_items = 10
@@ -62,7 +63,7 @@ class AutoCompleteMixin(object):
             path = request.path
 
             # must be called from /form/ ...
-            path = re.sub(r'/form(/[^/]+)?/?$', '', path)
+            path = _FORM_PATH_RE.sub('', path)
             path = '%s/autocomplete/%s/' % (path, name)
             item['autocomplete_url'] = urlsplit(request.build_absolute_uri(path)).path
 
@@ -1,6 +1,5 @@
 # noinspection PyUnresolvedReferences
 import inspect
-import re
 from urllib.parse import urlsplit
 
 from django.db.models import ManyToManyField
@@ -12,12 +11,14 @@ from rest_framework.response import Response
 from rest_framework.serializers import ListSerializer, ModelSerializer
 import django.db.models
 
+from .rest import _FORM_PATH_RE
+
 
 class M2MEnabledMetadata(SimpleMetadata):
     def get_field_info(self, field):
         ret = super().get_field_info(field)
         print('field', field)
-        if isinstance(field, serializers.ManyRelatedField) or isinstance(field, ListSerializer):
+        if isinstance(field, (serializers.ManyRelatedField, ListSerializer)):
             ret['multiple'] = True
         return ret
 
@@ -71,7 +72,7 @@ class ForeignFieldAutoCompleteMixin(object):
             path = request.path
 
             # must be called from /form/ or /form/<formid>/
-            path = re.sub(r'/form(/[^/]+)?/?$', '', path)
+            path = _FORM_PATH_RE.sub('', path)
             path = '%s/foreign-autocomplete/%s/' % (path, item_id)
             item['autocomplete_url'] = urlsplit(request.build_absolute_uri(path)).path
 
@@ -1,19 +1,59 @@
 # noinspection PyUnresolvedReferences
+import copy
 import functools
-import inspect
-import os
 import re
+import threading
+from collections import OrderedDict
 
 from django.conf import settings
-from django.core.exceptions import FieldDoesNotExist
 from django.db.models import TextField
-from django.http import Http404
-from django.utils.translation import gettext
+from django.http import Http404, HttpResponse
+from django.utils.translation import gettext, gettext_noop, get_language
 from rest_framework import renderers
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
 
+# strips the trailing /form or /form/<form_id>/ from request path
+_FORM_PATH_RE = re.compile(r'/form(/[^/]+)?/?$')
+
+# user facing messages, marked for makemessages here and translated via _translated_messages()
+_EDITING_TITLE = gettext_noop('Editing %s')
+_CREATING_TITLE = gettext_noop('Creating a new %s')
+_SAVE_LABEL = gettext_noop('Save')
+_CREATE_LABEL = gettext_noop('Create')
+_CANCEL_LABEL = gettext_noop('Cancel')
+
+_MESSAGES = (_EDITING_TITLE, _CREATING_TITLE, _SAVE_LABEL, _CREATE_LABEL, _CANCEL_LABEL)
+
+# form actions for editing an existing instance and creating a new one, labels are translated on use
+_EDIT_ACTIONS = (
+    {
+        'id': 'save',
+        'color': 'primary',
+        'label': _SAVE_LABEL
+    },
+    {
+        'id': 'cancel',
+        'label': _CANCEL_LABEL,
+        'cancel': True
+    },
+)
+
+_CREATE_ACTIONS = (
+    {
+        'id': 'create',
+        'color': 'primary',
+        'label': _CREATE_LABEL
+    },
+    {
+        'id': 'cancel',
+        'label': _CANCEL_LABEL,
+        'cancel': True
+    },
+)
+
+
 class AngularFormMixin(object):
     """
         A viewset mixin that provides django.forms like interface for user interfaces built upon django rest framework.
@@ -41,6 +81,9 @@ class AngularFormMixin(object):
              can be found at https://github.com/mesemus/django-angular-dynamic-forms/blob/develop/angular/src/impl/django-form-iface.ts
            * a call to AngularFormMixin.columns(...) or AngularFormMixin.fieldset(...) - see the All controls and layout
              demo for details
+
+        It might also be a callable taking the serializer field info and returning the layout. It is called on every
+        request, with cache_form_metadata on only once per serializer class, form and language.
     """
     form_layout = None
 
@@ -54,6 +97,7 @@ class AngularFormMixin(object):
         associated serializer.
         See https://github.com/mesemus/django-angular-dynamic-forms/blob/develop/angular/src/impl/django-form-iface.ts
         for a list of recognized items.
+        Might be a callable taking the serializer field info, called as often as a callable form_layout.
     """
     form_defaults = {}
 
@@ -70,6 +114,36 @@ class AngularFormMixin(object):
     """
     linked_forms = {}
 
+    """
+    If True, the serializer-derived part of the form layout is computed once per viewset class, serializer class,
+    form name and language and reused for subsequent requests. Only turn it on if the serializer fields do not
+    depend on the request (for example fields made read only for some users) and callable form_layout and
+    form_defaults do not need to be called on every request.
+    """
+    cache_form_metadata = False
+
+    """
+    If True, the rendered JSON of the form is cached per viewset class, request path and language and returned
+    without building the form again. Only use it if the whole form is determined by these - no callables in the
+    layout, _decorate_layout_item, form title and actions not depending on the user or the query etc.
+    """
+    cache_form_responses = False
+
+    # (viewset class, serializer class, form name, language) => layout merged with serializer field info,
+    # shared by all viewsets
+    _form_metadata_cache = {}
+
+    # model => frozenset of names of its TextFields
+    _textfield_names_cache = {}
+
+    # viewset class => map of form_id => url path of the @form_action handling the form
+    _angular_form_url_cache = {}
+
+    # see _form_response_cache_key => rendered json, at most _form_response_cache_size least recently used forms
+    _form_response_cache = OrderedDict()
+    _form_response_cache_lock = threading.Lock()
+    _form_response_cache_size = 1024
+
     @staticmethod
     def fieldset(title, controls):
         """
@@ -114,38 +188,78 @@ class AngularFormMixin(object):
     # noinspection PyUnusedLocal
     @action(detail=True, renderer_classes=[renderers.JSONRenderer], url_path='form')
     def form(self, request, *args, **kwargs):
-        return Response(self._get_form_metadata(has_instance=True,
-                                                base_path=self._base_path(request.path)))
+        return self._form_response(has_instance=True,
+                                   base_path=self._base_path(request.path))
 
     # noinspection PyUnusedLocal
     @action(detail=False, renderer_classes=[renderers.JSONRenderer], url_path='form')
     def form_list(self, request, *args, **kwargs):
-        return Response(self._get_form_metadata(has_instance=False,
-                                                base_path=self._base_path(request.path)))
+        return self._form_response(has_instance=False,
+                                   base_path=self._base_path(request.path))
 
     # noinspection PyUnusedLocal
     @action(detail=True, renderer_classes=[renderers.JSONRenderer], url_path='form/(?P<form_name>.+)')
     def form_with_name(self, request, *args, form_name=None, **kwargs):
-        return Response(self._get_form_metadata(has_instance=True, form_name =form_name or '',
-                                                base_path=self._base_path(request.path, 2)))
+        return self._form_response(has_instance=True, form_name=form_name or '',
+                                   base_path=self._base_path(request.path, 2))
 
     # noinspection PyUnusedLocal
     @action(detail=False, renderer_classes=[renderers.JSONRenderer], url_path='form/(?P<form_name>.+)')
     def form_list_with_name(self, request, *args, form_name=None, **kwargs):
-        return Response(self._get_form_metadata(has_instance=False, form_name =form_name or '',
-                                                base_path=self._base_path(request.path, 2)))
+        return self._form_response(has_instance=False, form_name=form_name or '',
+                                   base_path=self._base_path(request.path, 2))
 
     @staticmethod
     def _base_path(path, level=1):
-        if path.endswith('/'):
-            path = path[:-1]
-        for _lev in range(level):
-            path = os.path.dirname(path)
-        return path + '/'
+        # strips the last "level" segments of the path, i.e. /.../form/ or /.../form/<form_id>/
+        return path.rstrip('/').rsplit('/', level)[0] + '/'
     #
     # the rest of the methods on this class are private ones
     #
 
+    def _form_response(self, has_instance, form_name='', base_path=None):
+        if not self.cache_form_responses:
+            return Response(self._get_form_metadata(has_instance=has_instance, form_name=form_name,
+                                                    base_path=base_path))
+
+        key = self._form_response_cache_key(form_name)
+        cache = self._form_response_cache
+        with self._form_response_cache_lock:
+            content = cache.get(key)
+            if content is not None:
+                cache.move_to_end(key)
+
+        if content is None:
+            content = renderers.JSONRenderer().render(
+                self._get_form_metadata(has_instance=has_instance, form_name=form_name, base_path=base_path))
+            with self._form_response_cache_lock:
+                cache[key] = content
+                # evict the least recently used forms
+                while len(cache) > self._form_response_cache_size:
+                    cache.popitem(last=False)
+        return HttpResponse(content, content_type='application/json')
+
+    def _form_response_cache_key(self, form_name):
+        """
+        The form is given by the request path plus the few other request values it reads. Any other query
+        parameters are left out of the key, so that they can not be used to flood the cache.
+        """
+        # noinspection PyUnresolvedReferences
+        request = self.request
+
+        # scheme and host only show up in the form with absolute urls
+        host = None
+        if getattr(settings, 'ANGULAR_FORM_ABSOLUTE_URLS', False):
+            host = request.scheme, request.get_host()
+
+        # linked forms take the id of the linked instance from the query
+        link_id = None
+        form_def = self.linked_forms.get(form_name) if form_name else None
+        if form_def and form_def.get('link_id'):
+            link_id = request.GET.get(form_def['link_id'])
+
+        return type(self), host, request.path, link_id, get_language()
+
     def _get_form_layout(self, fields, form_name):
         if form_name:
             form_layout = self.form_layouts[form_name]
@@ -167,83 +281,131 @@ class AngularFormMixin(object):
                 layout = form_layout
         else:
             # no layout, generate from fields
-            layout = [self._get_field_layout(field_name, fields[field_name])
-                        for field_name in fields if not fields[field_name]['read_only']]
+            layout = [self._get_field_layout(field_name, field)
+                        for field_name, field in fields.items() if not field['read_only']]
 
-        layout = self._transform_layout(layout, form_defaults, wrap_array=False)
+        layout = self._transform_layout(layout, form_defaults, fields, self._get_textfield_names(), wrap_array=False)
 
         return layout
 
+    def _get_textfield_names(self):
+        """
+        Returns names of the model's TextFields, these are rendered as textarea instead of a single line input
+        """
+        # the class level queryset is enough to get the model, get_queryset() would clone (and maybe filter) it
+        queryset = getattr(self, 'queryset', None)
+        if queryset is None:
+            # noinspection PyUnresolvedReferences
+            queryset = self.get_queryset()
+        model = queryset.model
+        names = self._textfield_names_cache.get(model)
+        if names is None:
+            if model:
+                # TextFields are always forward fields, there is no need to let get_fields() build the reverse
+                # relations of all models
+                # noinspection PyProtectedMember
+                names = frozenset(f.name for f in model._meta.fields if isinstance(f, TextField))
+            else:
+                names = frozenset()
+            self._textfield_names_cache[model] = names
+        return names
+
     def _convert_camel_case(self, x):
-        if isinstance(x, dict):
-            for k, v in list(x.items()):
-                self._convert_camel_case(v)
-                camel_k = camel(k)
-                if camel_k != k:
-                    del x[k]
-                    x[camel_k] = v
-        if isinstance(x, tuple) or isinstance(x, list):
-            for v in x:
-                self._convert_camel_case(v)
+        stack = [x]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                for v in node.values():
+                    if isinstance(v, (dict, list, tuple)):
+                        stack.append(v)
+                _camel_case_keys(node)
+            elif isinstance(node, (list, tuple)):
+                stack.extend(node)
         return x
 
     def _get_field_layout(self, field_name, field):
         return {'id': field_name}
 
     # @LoggerDecorator.log()
-    def _transform_layout(self, layout, form_defaults, wrap_array=True):
+    def _transform_layout(self, layout, form_defaults, fields_info, textfield_names, wrap_array=True):
 
-        if isinstance(layout, dict):
-            layout = layout.copy()
+        # a plain field name is the most common item, handle it without going through the dict branch
+        if isinstance(layout, str):
+            if layout in form_defaults:
+                return self._transform_layout({
+                    'id': layout
+                }, form_defaults, fields_info, textfield_names)
+
+            md = dict(fields_info.get(layout, {}))
+            md['id'] = layout
+            return self._finish_field_layout(md, layout in textfield_names)
 
+        if isinstance(layout, dict):
+            # the layout comes from class attributes - copy it only when it needs to be modified
             if 'id' in layout and layout['id'] in form_defaults:
-                layout.update(form_defaults[layout['id']])
+                layout = {**layout, **form_defaults[layout['id']]}
 
-            for (k, v) in list(layout.items()):
+            for v in layout.values():
                 if callable(v):
-                    layout[k] = v(self)
-
-            layout_type = layout.get('type', 'string')
-
-            if layout_type in ('fieldset', 'group'):
-                layout['controls'] = self._transform_layout(layout['controls'], form_defaults, wrap_array=False)
-                return layout
-
-            if layout_type == 'columns':
-                layout['controls'] = self._transform_layout(layout['columns'], form_defaults, wrap_array=False)
-                del layout['columns']
-                return layout
-
-            if layout_type == 'string':
-                # string or textarea?
-                qs = self.get_queryset()
-                model = qs.model
-                if model:
-                    try:
-                        field = model._meta.get_field(layout['id'])
-                        if isinstance(field, TextField):
-                            layout['type'] = 'textarea'
-                    except FieldDoesNotExist:
-                        pass
-            return layout
+                    # the item depends on the request, it is transformed in _decorate_layout after calling the values
+                    return _DeferredLayoutItem(layout, form_defaults, fields_info, textfield_names)
+
+            return self._transform_layout_item(layout, form_defaults, fields_info, textfield_names)
 
-        if isinstance(layout, list) or isinstance(layout, tuple):
+        if isinstance(layout, (list, tuple)):
             # otherwise it is a group of controls
             if wrap_array:
                 return {
                     'type': 'group',
-                    'controls': [self._transform_layout(l, form_defaults) for l in layout]
+                    'controls': [self._transform_layout(l, form_defaults, fields_info, textfield_names)
+                                 for l in layout]
                 }
             else:
-                return [self._transform_layout(l, form_defaults) for l in layout]
-
-        if isinstance(layout, str):
-            return self._transform_layout({
-                'id': layout
-            }, form_defaults)
+                return [self._transform_layout(l, form_defaults, fields_info, textfield_names)
+                        for l in layout]
 
         raise NotImplementedError('Layout "%s" not implemented' % layout)
 
+    def _transform_layout_item(self, layout, form_defaults, fields_info, textfield_names):
+        """
+        Transforms a dict item of the layout whose values are not callables
+        """
+        layout_type = layout.get('type', 'string')
+
+        if layout_type in ('fieldset', 'group'):
+            layout = dict(layout)
+            layout['controls'] = self._transform_layout(layout['controls'], form_defaults, fields_info,
+                                                        textfield_names, wrap_array=False)
+            return layout
+
+        if layout_type == 'columns':
+            layout = dict(layout)
+            layout['controls'] = self._transform_layout(layout.pop('columns'), form_defaults, fields_info,
+                                                        textfield_names, wrap_array=False)
+            return layout
+
+        # merge in the field info from serializer, values from layout take precedence
+        md = dict(fields_info.get(layout['id'], {}))
+        md.update(layout)
+        return self._finish_field_layout(md, layout_type == 'string' and layout['id'] in textfield_names)
+
+    @staticmethod
+    def _finish_field_layout(md, textarea):
+        # string or textarea?
+        if textarea:
+            md['type'] = 'textarea'
+
+        if md['type'] == 'choice':
+            md['type'] = 'select'
+        if md.get('choices'):
+            md['choices'] = [
+                {
+                    'label': x.get('label', None) or x.get('display_name', None),
+                    'value': x['value']
+                } for x in md['choices']
+            ]
+        return md
+
     def _get_form_title(self, has_instance, serializer, form_name):
         form_title = self.form_title
         if form_name and self.form_titles:
@@ -255,40 +417,19 @@ class AngularFormMixin(object):
         # noinspection PyProtectedMember
         name = serializer.Meta.model._meta.verbose_name
         if has_instance:
-            name = gettext('Editing %s') % name
+            name = _translated_messages()[_EDITING_TITLE] % name
         else:
-            name = gettext('Creating a new %s') % name
+            name = _translated_messages()[_CREATING_TITLE] % name
 
         return name
 
     # noinspection PyMethodMayBeStatic,PyUnusedLocal
     def _get_actions(self, has_instance, serializer):
-        if has_instance:
-            return [
-                {
-                    'id': 'save',
-                    'color': 'primary',
-                    'label': gettext('Save')
-                },
-                {
-                    'id': 'cancel',
-                    'label': gettext('Cancel'),
-                    'cancel': True
-                },
-            ]
-        else:
-            return [
-                {
-                    'id': 'create',
-                    'color': 'primary',
-                    'label': gettext('Create')
-                },
-                {
-                    'id': 'cancel',
-                    'label': gettext('Cancel'),
-                    'cancel': True
-                },
-            ]
+        messages = _translated_messages()
+        return [
+            dict(action, label=messages[action['label']])
+            for action in (_EDIT_ACTIONS if has_instance else _CREATE_ACTIONS)
+        ]
 
     def _get_form_metadata(self, has_instance, form_name='', base_path=None):
 
@@ -297,11 +438,10 @@ class AngularFormMixin(object):
             if form_name in self.linked_forms:
                 return self._linked_form_metadata(form_name)
 
-            if not self.form_layouts:
-                raise Http404('Form layouts not configured. '
-                                            'Please add form_layouts attribute on the viewset class')
-
             if form_name not in self.form_layouts:
+                if not self.form_layouts:
+                    raise Http404('Form layouts not configured. '
+                                                'Please add form_layouts attribute on the viewset class')
                 raise Http404('Form with name %s not found' % form_name)
 
         ret = {}
@@ -309,14 +449,8 @@ class AngularFormMixin(object):
         # noinspection PyUnresolvedReferences
         serializer = self.get_serializer()
 
-        # noinspection PyUnresolvedReferences
-        metadata_class = self.metadata_class()
-
-        fields_info = metadata_class.get_serializer_info(serializer=serializer)
-        layout = self._get_form_layout(fields_info, form_name)
-        layout = self._decorate_layout(layout, fields_info)
-
-        ret['layout'] = self._convert_camel_case(layout)
+        layout, shared = self._get_static_layout(form_name, serializer)
+        ret['layout'] = self._decorate_layout(layout, shared)
 
         ret['formTitle'] = self._get_form_title(has_instance, serializer, form_name)
 
@@ -333,17 +467,44 @@ class AngularFormMixin(object):
         # print(json.dumps(ret, indent=4))
         return ret
 
-    @functools.lru_cache(maxsize=16)
+    def _get_static_layout(self, form_name, serializer):
+        """
+        Returns the layout with field info of the given serializer merged in, before any request-dependent processing,
+        and True if the layout is shared with other requests (cache_form_metadata is set) and must not be modified.
+        """
+        if self.cache_form_metadata:
+            key = (type(self), type(serializer), form_name, get_language())
+            layout = self._form_metadata_cache.get(key)
+            if layout is not None:
+                return layout, True
+
+        # noinspection PyUnresolvedReferences
+        metadata_class = self.metadata_class()
+
+        fields_info = metadata_class.get_serializer_info(serializer=serializer)
+        layout = self._get_form_layout(fields_info, form_name)
+
+        if self.cache_form_metadata:
+            return self._form_metadata_cache.setdefault(key, layout), True
+        return layout, False
+
     def _get_url_by_form_id(self, form_id):
         if not form_id:
             return ''
-        method = inspect.getmembers(self, lambda fld: callable(fld) and getattr(fld, 'angular_form_id', None) == form_id)
-        if not method:
-            return ''
-        ret = method[0][1].url_path
-        if not ret.endswith('/'):
-            ret += '/'
-        return ret
+        clz = type(self)
+        urls = self._angular_form_url_cache.get(clz)
+        if urls is None:
+            urls = {}
+            for name in dir(clz):
+                method = getattr(clz, name, None)
+                method_form_id = getattr(method, 'angular_form_id', None)
+                if method_form_id and callable(method) and method_form_id not in urls:
+                    url = method.url_path
+                    if not url.endswith('/'):
+                        url += '/'
+                    urls[method_form_id] = url
+            self._angular_form_url_cache[clz] = urls
+        return urls.get(form_id, '')
 
     def _linked_form_metadata(self, form_name):
         request = self.request
@@ -361,7 +522,7 @@ class AngularFormMixin(object):
 
         path = request.path
         # must be called from /form/ ...
-        path = re.sub(r'/form(/[^/]+)?/?$', '', path)
+        path = _FORM_PATH_RE.sub('', path)
         path = '%s/%s/' % (path, form_name)
 
         ret = viewset._get_form_metadata(link_id, form_name=form_def['form_id'], base_path=path)
@@ -369,42 +530,119 @@ class AngularFormMixin(object):
         return ret
 
     # @LoggerDecorator.log()
-    def _decorate_layout(self, layout, fields_info):
-        if isinstance(layout, list):
-            ret = []
-            for it in layout:
-                ret.append(self._decorate_layout(it, fields_info))
-            return ret
-        elif isinstance(layout, dict):
-            if layout.get('type', None) in ('fieldset', 'columns', 'group'):
-                layout = dict(layout)
-                layout['controls'] = self._decorate_layout(layout['controls'], fields_info)
-                self._decorate_layout_item(layout)
-                return layout
-            else:
-                md = dict(fields_info.get(layout['id'], {}))
-                md.update(layout)
-                if md['type'] == 'choice':
-                    md['type'] = 'select'
-                if md.get('choices'):
-                    md['choices'] = [
-                        {
-                            'label': x.get('label', None) or x.get('display_name', None),
-                            'value': x['value']
-                        } for x in md['choices']
-                    ]
-                self._decorate_layout_item(md)
-                return md
+    def _decorate_layout(self, layout, shared):
+        """
+        Request dependent processing of the static layout, done in a single pass: transforms items with callable
+        values, calls _decorate_layout_item and converts the keys to camel case. Returns a new layout, the static one
+        is left untouched. If it is shared with other requests, nested values of the items are copied as well.
+
+        The tree is walked with an explicit stack. _decorate_layout_item is called on an item only after all its
+        controls, in the same order as a recursive walk would do. Keys are converted to camel case after all the
+        hooks were called, so every hook sees snake_case keys on its item and on all the controls below it.
+        """
+        ret = [layout]
+        # (container, index or key of the node in it, node, True if node is a copied item with controls finished)
+        stack = [(ret, 0, layout, False)]
+        # all the items, converted to camel case only after all hooks were called
+        items = []
+        while stack:
+            parent, key, node, finish = stack.pop()
+
+            if finish:
+                self._decorate_layout_item(node)
+                items.append(node)
+                continue
+
+            if isinstance(node, list):
+                node = parent[key] = list(node)
+                stack.extend((node, idx, it, False) for idx, it in reversed(list(enumerate(node))))
+                continue
+
+            if isinstance(node, _DeferredLayoutItem):
+                # freshly built for this request, its controls might contain deferred items as well
+                node = node.resolve(self)
+
+            item = {}
+            for (k, v) in node.items():
+                if shared and k != 'controls' and isinstance(v, (dict, list, tuple)):
+                    # nested field info (choices, child serializer, ...), _decorate_layout_item may modify it
+                    v = copy.deepcopy(v)
+                item[k] = v
+            parent[key] = item
+
+            stack.append((parent, key, item, True))
+            if item.get('type', None) in ('fieldset', 'columns', 'group'):
+                stack.append((item, 'controls', item['controls'], False))
+
+        for item in items:
+            # controls are converted as items on their own, just the keys and nested values of this item
+            for k, v in item.items():
+                if k != 'controls' and isinstance(v, (dict, list, tuple)):
+                    self._convert_camel_case(v)
+            _camel_case_keys(item)
+
+        return ret[0]
 
     def _decorate_layout_item(self, item):
         pass
 
 
 # privates
+class _DeferredLayoutItem(object):
+    """
+    A layout item with callable values, kept in the cached layout instead of the transformed item. The values are
+    called with the viewset on each request and only then is the item transformed, as they might change its type,
+    choices etc.
+    """
+    def __init__(self, layout, form_defaults, fields_info, textfield_names):
+        self.layout = layout
+        self.form_defaults = form_defaults
+        self.fields_info = fields_info
+        self.textfield_names = textfield_names
+
+    def resolve(self, viewset):
+        layout = {k: v(viewset) if callable(v) else v for (k, v) in self.layout.items()}
+        # noinspection PyProtectedMember
+        return viewset._transform_layout_item(layout, self.form_defaults, self.fields_info, self.textfield_names)
+
+
+def _translated_messages():
+    """
+    Returns a map of msgid => translation of the library's own static messages in the active language
+    """
+    return _translate_messages(get_language())
+
+
+@functools.lru_cache(maxsize=64)
+def _translate_messages(language):
+    # gettext translates to the active language, which is the one passed in
+    return {message: gettext(message) for message in _MESSAGES}
+
+
+def _camel_case_keys(node):
+    """
+    Renames the keys of a dict to camel case in place, nested values are not converted
+    """
+    # collect the renames first, the dict can not be modified while iterating over it
+    renames = None
+    for k in node:
+        camel_k = camel(k)
+        if camel_k != k:
+            if renames is None:
+                renames = []
+            renames.append((k, camel_k))
+    if renames:
+        for k, camel_k in renames:
+            node[camel_k] = node.pop(k)
+
+
+@functools.lru_cache(maxsize=None)
 def camel(snake_str):
     if '_' not in snake_str:
         return snake_str
-    first, *others = snake_str.split('_')
-    return ''.join([first.lower(), *map(str.title, others)])
+    # same as lowering the first part and title-casing the others: '_' is uncased, so title() starts
+    # a new word after each of them
+    sep = snake_str.index('_')
+    return snake_str[:sep].lower() + snake_str[sep:].title().replace('_', '')
 
 
@@ -1,3 +1,206 @@
-from django.test import TestCase
+import json
+from collections import OrderedDict
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+from rest_framework import viewsets
+from rest_framework.test import APIRequestFactory
+
+from angular_dynamic_forms import AngularFormMixin
+from angular_dynamic_forms.rest import camel
+from api.models import City
+from api.v_1.rest import CitySerializer, CityViewSet
+
+
+def get_form(viewset_class, path='/cities/form/', action='form_list', **extra):
+    view = viewset_class.as_view({'get': action})
+    response = view(APIRequestFactory().get(path, **extra))
+    if hasattr(response, 'render'):
+        response.render()
+    return json.loads(response.content.decode('utf-8'))
+
+
+class CallableChoicesViewSet(AngularFormMixin, viewsets.ModelViewSet):
+    queryset = City.objects.all()
+    serializer_class = CitySerializer
+
+    form_layout = [
+        {
+            'id': 'name',
+            'type': lambda viewset: 'choice',
+            'choices': lambda viewset: [{'value': 1, 'display_name': viewset.request.GET.get('label', 'One')}]
+        },
+        'zipcode'
+    ]
+
+    form_defaults = {
+        'zipcode': {
+            'choices': lambda viewset: [{'value': 'A', 'display_name': 'Zip A'}]
+        }
+    }
+
+
+class CallableLayoutValuesTest(SimpleTestCase):
+
+    def test_callable_type_and_choices(self):
+        name = get_form(CallableChoicesViewSet)['layout'][0]
+        self.assertEqual(name['type'], 'select')
+        self.assertEqual(name['choices'], [{'label': 'One', 'value': 1}])
+
+    def test_callable_choices_from_form_defaults(self):
+        zipcode = get_form(CallableChoicesViewSet)['layout'][1]
+        self.assertEqual(zipcode['type'], 'string')
+        self.assertEqual(zipcode['choices'], [{'label': 'Zip A', 'value': 'A'}])
+
+    def test_callables_called_per_request(self):
+        get_form(CallableChoicesViewSet)
+        name = get_form(CallableChoicesViewSet, '/cities/form/?label=Two')['layout'][0]
+        self.assertEqual(name['choices'], [{'label': 'Two', 'value': 1}])
+
+
+class ZipcodeOnlySerializer(CitySerializer):
+    class Meta(CitySerializer.Meta):
+        fields = ('zipcode', 'id')
+
+
+class PerRequestSerializerViewSet(AngularFormMixin, viewsets.ModelViewSet):
+    queryset = City.objects.all()
+
+    def get_serializer_class(self):
+        if self.request.GET.get('short'):
+            return ZipcodeOnlySerializer
+        return CitySerializer
+
+
+class CachedPerRequestSerializerViewSet(PerRequestSerializerViewSet):
+    cache_form_metadata = True
+
+
+class SerializerCountingViewSet(AngularFormMixin, viewsets.ModelViewSet):
+    queryset = City.objects.all()
+    serializer_class = CitySerializer
+    serializer_count = 0
+
+    def get_serializer(self, *args, **kwargs):
+        SerializerCountingViewSet.serializer_count += 1
+        return super().get_serializer(*args, **kwargs)
+
+
+class FormMetadataCacheTest(SimpleTestCase):
+
+    def assert_fields_follow_serializer(self, viewset_class):
+        full = get_form(viewset_class)['layout']
+        short = get_form(viewset_class, '/cities/form/?short=1')['layout']
+        self.assertEqual([it['id'] for it in full], ['name', 'zipcode', 'comment'])
+        self.assertEqual([it['id'] for it in short], ['zipcode'])
+
+    def test_not_cached_by_default(self):
+        self.assertFalse(AngularFormMixin.cache_form_metadata)
+        self.assert_fields_follow_serializer(PerRequestSerializerViewSet)
+
+    def test_cached_per_serializer_class(self):
+        self.assert_fields_follow_serializer(CachedPerRequestSerializerViewSet)
+
+    def test_serializer_built_once_per_request(self):
+        SerializerCountingViewSet.serializer_count = 0
+        get_form(SerializerCountingViewSet)
+        self.assertEqual(SerializerCountingViewSet.serializer_count, 1)
+
+
+class FormUrlTest(SimpleTestCase):
+
+    def test_form_action_url(self):
+        view = CityViewSet.as_view({'get': 'form_list_with_name'})
+        response = view(APIRequestFactory().get('/cities/form/custom/'), form_name='custom')
+        self.assertTrue(response.data['djangoUrl'].endswith('/cities/custom/'))
+
+    def test_base_path(self):
+        self.assertEqual(AngularFormMixin._base_path('/a/b/form/'), '/a/b/')
+        self.assertEqual(AngularFormMixin._base_path('/a/b/form/x/', 2), '/a/b/')
+
+
+class ContainerHookViewSet(AngularFormMixin, viewsets.ModelViewSet):
+    queryset = City.objects.all()
+    serializer_class = CitySerializer
+
+    form_layout = [
+        AngularFormMixin.fieldset('City', ['name', AngularFormMixin.fieldset('Detail', ['zipcode'])])
+    ]
+
+    def _decorate_layout_item(self, item):
+        super()._decorate_layout_item(item)
+        if item['type'] == 'fieldset':
+            item['seen_keys'] = sorted(item['controls'][0])
+
+
+class CachedChoicesHookViewSet(AngularFormMixin, viewsets.ModelViewSet):
+    queryset = City.objects.all()
+    serializer_class = CitySerializer
+    cache_form_metadata = True
+
+    form_layout = ['zipcode']
+
+    form_defaults = {
+        'zipcode': {
+            'choices': [{'value': 'A', 'display_name': 'Zip A'}]
+        }
+    }
+
+    def _decorate_layout_item(self, item):
+        super()._decorate_layout_item(item)
+        item['choices'].append({'label': 'Added', 'value': 'B'})
+
+
+class DecorateLayoutItemTest(SimpleTestCase):
+
+    def test_hooks_see_snake_case_controls(self):
+        outer = get_form(ContainerHookViewSet)['layout'][0]
+        self.assertIn('max_length', outer['seenKeys'])
+        self.assertIn('read_only', outer['seenKeys'])
+        self.assertIn('maxLength', outer['controls'][0])
+
+    def test_hooks_do_not_modify_cached_layout(self):
+        get_form(CachedChoicesHookViewSet)
+        zipcode = get_form(CachedChoicesHookViewSet)['layout'][0]
+        self.assertEqual([choice['value'] for choice in zipcode['choices']], ['A', 'B'])
+
+
+class CachedResponseViewSet(AngularFormMixin, viewsets.ModelViewSet):
+    queryset = City.objects.all()
+    serializer_class = CitySerializer
+    cache_form_responses = True
+    _form_response_cache = OrderedDict()
+    _form_response_cache_size = 2
+
+
+class FormResponseCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        CachedResponseViewSet._form_response_cache.clear()
+
+    def test_query_parameters_not_in_key(self):
+        for i in range(5):
+            get_form(CachedResponseViewSet, '/cities/form/?random=%s' % i)
+        self.assertEqual(len(CachedResponseViewSet._form_response_cache), 1)
+
+    def test_least_recently_used_evicted(self):
+        view = CachedResponseViewSet.as_view({'get': 'form'})
+        for path in ('/cities/1/form/', '/cities/2/form/', '/cities/1/form/', '/cities/3/form/'):
+            view(APIRequestFactory().get(path), pk=path.split('/')[2])
+        paths = [key[2] for key in CachedResponseViewSet._form_response_cache]
+        self.assertEqual(paths, ['/cities/1/form/', '/cities/3/form/'])
+
+    @override_settings(ANGULAR_FORM_ABSOLUTE_URLS=True)
+    def test_scheme_in_key(self):
+        self.assertEqual(get_form(CachedResponseViewSet)['djangoUrl'], 'http://testserver/cities/')
+        self.assertEqual(get_form(CachedResponseViewSet, secure=True)['djangoUrl'], 'https://testserver/cities/')
+
+
+class CamelCaseTest(SimpleTestCase):
+
+    def test_equal_keys_keep_their_position(self):
+        # an equal but distinct string object must not be taken for a renamed key
+        camel(''.join(['na', 'me']))
+        key = ''.join(['na', 'me'])
+        node = {key: 1, 'max_length': 2, 'label': 3}
+        AngularFormMixin()._convert_camel_case(node)
+        self.assertEqual(list(node), ['name', 'label', 'maxLength'])